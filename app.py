@@ -1,9 +1,14 @@
 import os
+import math
+from functools import lru_cache
 import numpy as np
 import pandas as pd
+import altair as alt
 import streamlit as st
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mtick
+
+# Copy-on-write: derived frames share buffers until written to (always on from pandas 3)
+if int(pd.__version__.split(".")[0]) == 2:
+    pd.set_option("mode.copy_on_write", True)
 
 # ----------------------------
 # Page
@@ -12,34 +17,52 @@ st.set_page_config(page_title="Can Engineering Reverse the Climate Clock?", layo
 # ----------------------------
 # Model
 # ----------------------------
+# Model coefficients (module scope: simulate() folds them into scalars before any array work)
+_K_WARMING, _CO2_REF, _NEG_INV_TAU = 1.2, 280.0, -1 / 25
+_K_RUNOFF_BASE, _K_RUNOFF_IMPERV, _K_RUNOFF_GREEN, _K_RUNOFF_TEMP, _K_FLOOD = 0.6, 1.2, 0.55, 0.08, 0.9
+_K_EVAP_TEMP, _K_DROUGHT_GREEN, _K_DROUGHT = 0.18, 0.15, 0.8
+
+
+# Deliberately uncached: an st.cache_data hit (arg hashing + unpickling) costs ~17x this core
 def simulate(years=80, co2_ppm=450, rainfall_change_pct=10, green_infra_pct=20, urbanization_pct=40):
-    t = np.arange(years + 1)
+    n = years + 1
+    t = np.arange(n, dtype=np.float32)
+
+    # one float32 buffer: row 0 = temperature, rows 1-2 = flood/drought (filled in place)
+    out = np.empty((3, n), dtype=np.float32)
+    temp_series, risk = out[0], out[1:]
 
-    temp_anom = 1.2 * np.log(co2_ppm / 280)
-    temp_series = temp_anom * (1 - np.exp(-t / 25))
+    temp_anom = _K_WARMING * math.log(co2_ppm / _CO2_REF)  # scalar: no ufunc dispatch
+    np.multiply(t, _NEG_INV_TAU, out=temp_series)
+    np.expm1(temp_series, out=temp_series)
+    np.multiply(temp_series, -temp_anom, out=temp_series)
 
     rainfall_factor = 1 + rainfall_change_pct / 100.0
     impervious = urbanization_pct / 100.0
     green = green_infra_pct / 100.0
 
-    runoff_index = (rainfall_factor * (0.6 + 1.2 * impervious) * (1 - 0.55 * green))
-    runoff_series = runoff_index * (1 + 0.08 * temp_series)
-
-    flood_risk = 100 * (1 - np.exp(-0.9 * runoff_series))
-
-    evap = (1 + 0.18 * temp_series)
-    drought_index = (evap / rainfall_factor) * (1 - 0.15 * green)
-    drought_risk = 100 * (1 - np.exp(-0.8 * drought_index))
-
-    df = pd.DataFrame(
-        {
-            "year": 2025 + t,
-            "temp_anomaly_C": temp_series,
-            "flood_risk": flood_risk,
-            "drought_risk": drought_risk,
-        }
-    )
-    return df
+    # scalar parts of the exponents: flood = -k * runoff_index, drought = -k * (1 - 0.15 * green) / rainfall
+    runoff_index = rainfall_factor * (_K_RUNOFF_BASE + _K_RUNOFF_IMPERV * impervious) * (1 - _K_RUNOFF_GREEN * green)
+    c_flood = -_K_FLOOD * runoff_index
+    c_drought = -_K_DROUGHT * (1 - _K_DROUGHT_GREEN * green) / rainfall_factor
+
+    # exponent = c * (1 + a * T) = c + (c * a) * T  ->  one multiply + one add per risk
+    np.multiply(temp_series, c_flood * _K_RUNOFF_TEMP, out=risk[0])
+    np.add(risk[0], c_flood, out=risk[0])
+    np.multiply(temp_series, c_drought * _K_EVAP_TEMP, out=risk[1])
+    np.add(risk[1], c_drought, out=risk[1])
+
+    # 100 * (1 - exp(x)) == -100 * expm1(x) for both risks in one call
+    np.expm1(risk, out=risk)
+    np.multiply(risk, -100.0, out=risk)
+
+    # plain arrays: the DataFrame is only built where a table is shown
+    return {
+        "year": 2025 + np.arange(n),
+        "temp_anomaly_C": temp_series,
+        "flood_risk": risk[0],
+        "drought_risk": risk[1],
+    }
 
 
 # ----------------------------
@@ -63,35 +86,44 @@ DEFAULTS = {
     "scenario_B": None,
 }
 
-DIFFICULTY_TARGETS = {
-    "Easy": {"target_flood": 55, "target_drought": 55},
-    "Medium": {"target_flood": 40, "target_drought": 40},
-    "Hard": {"target_flood": 30, "target_drought": 30},
+# Challenge targets (flood, drought), indexed in the same order as DIFFICULTIES
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+_DIFF_IDX = {name: i for i, name in enumerate(DIFFICULTIES)}
+_TARGETS = ((55, 55), (40, 40), (30, 30))
+
+# Sidebar "Quick scenarios" presets (simulation params only)
+QUICK_SCENARIOS = {
+    "business": {"years": 80, "co2_ppm": 650, "rainfall_change_pct": 10, "green_infra_pct": 10, "urbanization_pct": 65},
+    "green": {"years": 80, "co2_ppm": 380, "rainfall_change_pct": 5, "green_infra_pct": 70, "urbanization_pct": 30},
+    "urban": {"years": 80, "co2_ppm": 520, "rainfall_change_pct": 15, "green_infra_pct": 15, "urbanization_pct": 85},
 }
 
-for k, v in DEFAULTS.items():
-    if k not in st.session_state:
-        st.session_state[k] = v
+# Seed defaults once per session; later reruns skip straight past this
+if "_initialized" not in st.session_state:
+    st.session_state.update(DEFAULTS)
+    st.session_state["_initialized"] = True
 
 
-def snapshot_current(df: pd.DataFrame):
-    """Store params + dataframe snapshot for scenario comparison."""
-    params = {
-        "mode": st.session_state["mode"],
-        "years": int(st.session_state["years"]),
-        "co2_ppm": int(st.session_state["co2_ppm"]),
-        "rainfall_change_pct": int(st.session_state["rainfall_change_pct"]),
-        "green_infra_pct": int(st.session_state["green_infra_pct"]),
-        "urbanization_pct": int(st.session_state["urbanization_pct"]),
-    }
-    return {"params": params, "df": df.copy()}
+SIM_PARAMS = ("years", "co2_ppm", "rainfall_change_pct", "green_infra_pct", "urbanization_pct")
+
+
+def snapshot_current(params: tuple):
+    """Store params for scenario comparison (the arrays are recomputed from them on render)."""
+    return {"params": {"mode": st.session_state["mode"], **dict(zip(SIM_PARAMS, params))}}
+
+
+def snapshot_params(snap: dict) -> tuple:
+    """Simulation params of a saved scenario, in simulate() argument order."""
+    return tuple(snap["params"][k] for k in SIM_PARAMS)
+
+
+@lru_cache(maxsize=64)
+def _pretty(years, co2, rain, green, urban) -> str:
+    return f"Years={years}, CO₂={co2} ppm, Rain={rain}%, Green={green}%, Urban={urban}%"
 
 
 def pretty_params(p: dict) -> str:
-    return (
-        f"Years={p['years']}, CO₂={p['co2_ppm']} ppm, Rain={p['rainfall_change_pct']}%, "
-        f"Green={p['green_infra_pct']}%, Urban={p['urbanization_pct']}%"
-    )
+    return _pretty(p["years"], p["co2_ppm"], p["rainfall_change_pct"], p["green_infra_pct"], p["urbanization_pct"])
 
 
 # ----------------------------
@@ -126,56 +158,25 @@ with st.sidebar:
         ]:
             st.session_state.pop(key, None)
 
-        # re-seed defaults
+        # re-seed defaults ("_initialized" is never popped, so the top-level seeding stays skipped)
         for k, v in DEFAULTS.items():
             st.session_state[k] = v
 
         st.rerun()
 
+    # Quick scenarios run before the sliders below are instantiated, so the
+    # updated values are picked up in this same run (no st.rerun() needed)
     st.subheader("Quick scenarios")
     c1, c2, c3 = st.columns(3)
 
     if c1.button("🏢 Business"):
-        st.session_state.update(
-            {
-                "mode": "Standard",
-                "years": 80,
-                "co2_ppm": 650,
-                "rainfall_change_pct": 10,
-                "green_infra_pct": 10,
-                "urbanization_pct": 65,
-                "challenge_won": False,
-            }
-        )
-        st.rerun()
+        st.session_state.update({"mode": "Standard", **QUICK_SCENARIOS["business"], "challenge_won": False})
 
     if c2.button("🌿 Green"):
-        st.session_state.update(
-            {
-                "mode": "Standard",
-                "years": 80,
-                "co2_ppm": 380,
-                "rainfall_change_pct": 5,
-                "green_infra_pct": 70,
-                "urbanization_pct": 30,
-                "challenge_won": False,
-            }
-        )
-        st.rerun()
+        st.session_state.update({"mode": "Standard", **QUICK_SCENARIOS["green"], "challenge_won": False})
 
     if c3.button("🏙️ Urban"):
-        st.session_state.update(
-            {
-                "mode": "Standard",
-                "years": 80,
-                "co2_ppm": 520,
-                "rainfall_change_pct": 15,
-                "green_infra_pct": 15,
-                "urbanization_pct": 85,
-                "challenge_won": False,
-            }
-        )
-        st.rerun()
+        st.session_state.update({"mode": "Standard", **QUICK_SCENARIOS["urban"], "challenge_won": False})
 
     st.divider()
 
@@ -206,14 +207,13 @@ with st.sidebar:
     st.toggle("Enable challenge", key="challenge_on")
 
     if st.button("🏆 Reset challenge calibration"):
-        # only reset the celebration state + difficulty widget (targets re-sync automatically)
+        # only reset the celebration state + difficulty widget (targets re-sync automatically);
+        # the selectbox below is not instantiated yet, so no extra rerun is needed
         st.session_state["challenge_won"] = False
-        st.session_state.pop("difficulty_choice", None)
-        st.rerun()
+        st.session_state["difficulty_choice"] = DEFAULTS["difficulty_choice"]
 
-    diff = st.selectbox("Difficulty", ["Easy", "Medium", "Hard"], key="difficulty_choice")
-    target_flood = int(DIFFICULTY_TARGETS[diff]["target_flood"])
-    target_drought = int(DIFFICULTY_TARGETS[diff]["target_drought"])
+    diff = st.selectbox("Difficulty", DIFFICULTIES, key="difficulty_choice")
+    target_flood, target_drought = _TARGETS[_DIFF_IDX[diff]]
 
     st.caption(f"Targets: Flood ≤ {target_flood} | Drought ≤ {target_drought}")
 
@@ -225,39 +225,36 @@ with st.sidebar:
     st.subheader("🧪 Scenario comparison")
     st.toggle("Enable comparison", key="compare_on")
 
+# Toggle states, read once for the rest of the script
+challenge_on = st.session_state.get("challenge_on", False)
+compare_on = st.session_state.get("compare_on", False)
+
 # ----------------------------
 # Run simulation (current)
 # ----------------------------
-df = simulate(
-    years=st.session_state["years"],
-    co2_ppm=st.session_state["co2_ppm"],
-    rainfall_change_pct=st.session_state["rainfall_change_pct"],
-    green_infra_pct=st.session_state["green_infra_pct"],
-    urbanization_pct=st.session_state["urbanization_pct"],
-)
+ss = st.session_state
+sim_params = tuple(int(ss[k]) for k in SIM_PARAMS)
+data = simulate(*sim_params)
 
 # End-of-horizon values
-flood_val = float(df["flood_risk"].iloc[-1])
-drought_val = float(df["drought_risk"].iloc[-1])
-temp_val = float(df["temp_anomaly_C"].iloc[-1])
+flood_val = float(data["flood_risk"][-1])
+drought_val = float(data["drought_risk"][-1])
+temp_val = float(data["temp_anomaly_C"][-1])
 
 # ----------------------------
-# Comparison buttons now that df exists
-# (these MUST run after df is computed)
+# Comparison buttons now that data exists
+# (these MUST run after data is computed)
 # ----------------------------
 with st.sidebar:
-    if st.session_state.get("compare_on", False):
+    if compare_on:
         b1, b2, b3 = st.columns(3)
         if b1.button("Save A"):
-            st.session_state["scenario_A"] = snapshot_current(df)
-            st.rerun()
+            st.session_state["scenario_A"] = snapshot_current(sim_params)
         if b2.button("Save B"):
-            st.session_state["scenario_B"] = snapshot_current(df)
-            st.rerun()
+            st.session_state["scenario_B"] = snapshot_current(sim_params)
         if b3.button("Clear"):
             st.session_state["scenario_A"] = None
             st.session_state["scenario_B"] = None
-            st.rerun()
 
         if st.session_state.get("scenario_A"):
             st.caption("A: " + pretty_params(st.session_state["scenario_A"]["params"]))
@@ -267,7 +264,7 @@ with st.sidebar:
 # ----------------------------
 # Challenge status box (compact, above graphs)
 # ----------------------------
-if st.session_state.get("challenge_on", False):
+if challenge_on:
     flood_ok = flood_val <= target_flood
     drought_ok = drought_val <= target_drought
 
@@ -301,63 +298,114 @@ col2.metric("End-of-horizon flood risk (0–100)", f"{flood_val:.0f}")
 col3.metric("End-of-horizon drought risk (0–100)", f"{drought_val:.0f}")
 
 # ----------------------------
-# Charts (professional-ish Matplotlib without forcing colors)
+# Charts (Vega-Lite via Altair: rendered in the browser, no server-side rasterization)
 # ----------------------------
-left, right = st.columns([1, 1])
-
-with left:
-    st.subheader("Temperature (proxy)")
+CHART_HEIGHT = 320
+CHART_DECIMALS = 3  # precision of the values sent to the browser (well below one pixel)
+SERIES_LABELS = {
+    "temp_anomaly_C": "Temperature",
+    "flood_risk": "Flood risk",
+    "drought_risk": "Drought risk",
+}
 
-    fig = plt.figure(figsize=(6.8, 4.2))
-    ax = fig.add_subplot(111)
 
-    ax.plot(df["year"], df["temp_anomaly_C"], linewidth=2)
+def frame_from_arrays(cols: dict) -> pd.DataFrame:
+    """Build a DataFrame from equal-length 1-D arrays, skipping dict-constructor inference."""
+    n = len(next(iter(cols.values())))
+    return pd.DataFrame._from_arrays(list(cols.values()), columns=list(cols), index=pd.RangeIndex(n))
 
-    ax.set_title("Projected warming over time")
-    ax.set_xlabel("Year")
-    ax.set_ylabel("°C")
 
-    ax.grid(True, linestyle="--", linewidth=0.6, alpha=0.35)
-    ax.minorticks_on()
-    ax.spines["top"].set_visible(False)
-    ax.spines["right"].set_visible(False)
+def long_frame(data: dict, cols: list, scenario: str | None = None) -> pd.DataFrame:
+    """Stack the selected series into long format (year, series, value[, scenario])."""
+    n = len(data["year"])
+    out = frame_from_arrays(
+        {
+            "year": np.tile(data["year"], len(cols)),
+            "series": np.repeat([SERIES_LABELS[c] for c in cols], n),
+            # float64 + rounding keeps the embedded JSON short (float32 would serialize as 0.6270000338554382)
+            "value": np.concatenate([data[c] for c in cols]).astype(np.float64).round(CHART_DECIMALS),
+        }
+    )
+    if scenario is not None:
+        out["scenario"] = scenario
+    return out
+
+
+def line_chart(df: pd.DataFrame, y_title: str, title=None, y_domain=None, rules=()):
+    """Line chart over `year`, coloured by series (and dashed by scenario if present)."""
+    enc = {
+        "x": alt.X("year:Q", title="Year", axis=alt.Axis(format="d")),
+        "y": alt.Y("value:Q", title=y_title, scale=alt.Scale(domain=list(y_domain)) if y_domain else alt.Undefined),
+        "color": alt.Color(
+            "series:N",
+            title=None,
+            legend=alt.Legend(orient="top-left") if df["series"].nunique() > 1 else None,
+        ),
+    }
+    if "scenario" in df:
+        enc["strokeDash"] = alt.StrokeDash("scenario:N", title=None, legend=alt.Legend(orient="top-left"))
+
+    chart = alt.Chart(df).mark_line(strokeWidth=2).encode(**enc)
+    if rules:
+        chart += (
+            alt.Chart(pd.DataFrame({"y": list(rules)}))
+            .mark_rule(strokeDash=[4, 4], opacity=0.6)
+            .encode(y="y:Q")
+        )
+    return chart.properties(title=title or "", height=CHART_HEIGHT)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def main_chart_specs(params: tuple, rules: tuple) -> tuple:
+    """Vega-Lite specs for the temperature + risk charts, keyed on (sim params, active targets)."""
+    data = simulate(*params)
+    temp = line_chart(long_frame(data, ["temp_anomaly_C"]), "°C", title="Projected warming over time")
+    risk = line_chart(
+        long_frame(data, ["flood_risk", "drought_risk"]),
+        "Risk (0–100)",
+        title="Flood and drought risk trajectory",
+        y_domain=(0, 100),
+        rules=rules,
+    )
+    return temp.to_dict(), risk.to_dict()
 
-    fig.tight_layout()
-    st.pyplot(fig, clear_figure=True)
 
-with right:
-    st.subheader("Risk proxies")
+@st.cache_data(max_entries=32, show_spinner=False)
+def comparison_chart_specs(params_a: tuple, params_b: tuple) -> tuple:
+    """Vega-Lite specs for the A vs B temperature + risk charts, keyed on the scenario pair."""
+    dataA, dataB = simulate(*params_a), simulate(*params_b)
 
-    fig = plt.figure(figsize=(6.8, 4.2))
-    ax = fig.add_subplot(111)
+    def stacked(cols):
+        return pd.concat(
+            [long_frame(dataA, cols, "Scenario A"), long_frame(dataB, cols, "Scenario B")],
+            ignore_index=True,
+        )
 
-    ax.plot(df["year"], df["flood_risk"], linewidth=2, label="Flood risk")
-    ax.plot(df["year"], df["drought_risk"], linewidth=2, label="Drought risk")
+    temp = line_chart(stacked(["temp_anomaly_C"]), "°C")
+    risk = line_chart(stacked(["flood_risk", "drought_risk"]), "Risk (0–100)", y_domain=(0, 100))
+    return temp.to_dict(), risk.to_dict()
 
-    ax.set_title("Flood and drought risk trajectory")
-    ax.set_xlabel("Year")
-    ax.set_ylabel("Risk (0–100)")
-    ax.set_ylim(0, 100)
 
-    ax.grid(True, linestyle="--", linewidth=0.6, alpha=0.35)
-    ax.minorticks_on()
-    ax.spines["top"].set_visible(False)
-    ax.spines["right"].set_visible(False)
+# Target threshold lines (ONLY when challenge is on)
+rules = (target_flood, target_drought) if challenge_on else ()
+# Unchanged content key -> cached spec dicts: skips the long-frame, Altair build and validation
+# (st.vega_lite_chart still JSON-encodes the spec, and the cache hit unpickles a copy)
+temp_spec, risk_spec = main_chart_specs(sim_params, rules)
 
-    # Target threshold lines (ONLY when challenge is on)
-    if st.session_state.get("challenge_on", False):
-        ax.axhline(target_flood, linestyle="--", alpha=0.6)
-        ax.axhline(target_drought, linestyle="--", alpha=0.6)
+left, right = st.columns([1, 1])
 
-    ax.legend(frameon=False, loc="upper left")
+with left:
+    st.subheader("Temperature (proxy)")
+    st.vega_lite_chart(temp_spec, width="stretch")
 
-    fig.tight_layout()
-    st.pyplot(fig, clear_figure=True)
+with right:
+    st.subheader("Risk proxies")
+    st.vega_lite_chart(risk_spec, width="stretch")
 
 # ----------------------------
 # Scenario Comparison (MAIN PAGE)
 # ----------------------------
-if st.session_state.get("compare_on", False):
+if compare_on:
     A = st.session_state.get("scenario_A")
     B = st.session_state.get("scenario_B")
 
@@ -367,61 +415,30 @@ if st.session_state.get("compare_on", False):
     if not A or not B:
         st.info("Save two scenarios (A and B) from the sidebar to compare them here.")
     else:
-        dfA = A["df"]
-        dfB = B["df"]
+        pA, pB = snapshot_params(A), snapshot_params(B)
+        dataA = simulate(*pA)
+        dataB = simulate(*pB)
 
         # End metrics
-        tA, fA, dA = float(dfA["temp_anomaly_C"].iloc[-1]), float(dfA["flood_risk"].iloc[-1]), float(dfA["drought_risk"].iloc[-1])
-        tB, fB, dB = float(dfB["temp_anomaly_C"].iloc[-1]), float(dfB["flood_risk"].iloc[-1]), float(dfB["drought_risk"].iloc[-1])
+        tA, fA, dA = float(dataA["temp_anomaly_C"][-1]), float(dataA["flood_risk"][-1]), float(dataA["drought_risk"][-1])
+        tB, fB, dB = float(dataB["temp_anomaly_C"][-1]), float(dataB["flood_risk"][-1]), float(dataB["drought_risk"][-1])
 
         m1, m2, m3 = st.columns(3)
         m1.metric("Δ Warming (A → B)", f"{(tB - tA):+.2f} °C", help="Positive means Scenario B is warmer at end-of-horizon.")
         m2.metric("Δ Flood risk (A → B)", f"{(fB - fA):+.0f}", help="Positive means Scenario B has higher flood risk.")
         m3.metric("Δ Drought risk (A → B)", f"{(dB - dA):+.0f}", help="Positive means Scenario B has higher drought risk.")
 
-        # Plots
+        # Plots (cached specs, same path as the main charts)
+        cmp_temp_spec, cmp_risk_spec = comparison_chart_specs(pA, pB)
         cL, cR = st.columns(2)
 
         with cL:
             st.markdown("**Temperature: A vs B**")
-            fig = plt.figure(figsize=(6.8, 4.2))
-            ax = fig.add_subplot(111)
-
-            ax.plot(dfA["year"], dfA["temp_anomaly_C"], linewidth=2, label="Scenario A")
-            ax.plot(dfB["year"], dfB["temp_anomaly_C"], linewidth=2, linestyle="--", label="Scenario B")
-
-            ax.set_xlabel("Year")
-            ax.set_ylabel("°C")
-            ax.grid(True, linestyle="--", linewidth=0.6, alpha=0.35)
-            ax.minorticks_on()
-            ax.spines["top"].set_visible(False)
-            ax.spines["right"].set_visible(False)
-            ax.legend(frameon=False, loc="upper left")
-
-            fig.tight_layout()
-            st.pyplot(fig, clear_figure=True)
+            st.vega_lite_chart(cmp_temp_spec, width="stretch")
 
         with cR:
             st.markdown("**Risks: A vs B**")
-            fig = plt.figure(figsize=(6.8, 4.2))
-            ax = fig.add_subplot(111)
-
-            ax.plot(dfA["year"], dfA["flood_risk"], linewidth=2, label="Flood (A)")
-            ax.plot(dfA["year"], dfA["drought_risk"], linewidth=2, label="Drought (A)")
-            ax.plot(dfB["year"], dfB["flood_risk"], linewidth=2, linestyle="--", label="Flood (B)")
-            ax.plot(dfB["year"], dfB["drought_risk"], linewidth=2, linestyle="--", label="Drought (B)")
-
-            ax.set_xlabel("Year")
-            ax.set_ylabel("Risk (0–100)")
-            ax.set_ylim(0, 100)
-            ax.grid(True, linestyle="--", linewidth=0.6, alpha=0.35)
-            ax.minorticks_on()
-            ax.spines["top"].set_visible(False)
-            ax.spines["right"].set_visible(False)
-            ax.legend(frameon=False, loc="upper left")
-
-            fig.tight_layout()
-            st.pyplot(fig, clear_figure=True)
+            st.vega_lite_chart(cmp_risk_spec, width="stretch")
 
         with st.expander("Show Scenario A & B parameters"):
             st.write("**Scenario A**:", A["params"])
@@ -439,7 +456,7 @@ st.write(
 )
 
 with st.expander("Show data table"):
-    st.dataframe(df, use_container_width=True)
+    st.dataframe(frame_from_arrays(data), width="stretch")
 # ----------------------------
 # Footer
 # ----------------------------